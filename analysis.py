@@ -1,12 +1,99 @@
 import json
 import pymongo
+from pymongo import UpdateOne
+from pymongo.write_concern import WriteConcern
 import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-from typing import List, Dict
+from typing import List, Dict, NamedTuple, Tuple
 import os
 from docx import Document
-from collections import defaultdict
-import subprocess
+from collections import namedtuple
+import functools
+import hashlib
+import heapq
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+M2_SECTIONS = frozenset({'Hard', 'Adaptive', 'Module 2', 'AdaptiveHard'})
+SUBJECTS = ['Math', 'Reading and Writing']
+BULK_CHUNK_SIZE = 1000
+STUDENT_PROJECTION = {
+    '_id': 1, 'question_id': 1, 'subject.name': 1, 'section': 1, 'topic.name': 1,
+    'correct': 1, 'time_spent': 1, 'complexity': 1, 'compleixty': 1
+}
+
+@functools.lru_cache(maxsize=16)
+def _load_json_cached(path: str, mtime: float):
+    with open(path, 'rb') as f:
+        return _loads(f.read())
+
+def load_json(path: str):
+    """Load a JSON file, reusing the parsed result until the file's mtime changes."""
+    return _load_json_cached(path, os.path.getmtime(path))
+
+def file_md5(path: str, chunk_size: int = 1 << 20) -> str:
+    """Hash a file's contents in chunks so large files are never held in memory twice."""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+if njit is not None:
+    @njit(parallel=True, cache=True, fastmath=True)
+    def _sweep_thresholds(ratio, got_hard, thresholds):
+        """Prediction accuracy per threshold without materializing the threshold x student grid."""
+        accuracy = np.empty(thresholds.size)
+        for i in prange(thresholds.size):
+            hits = 0
+            for j in range(ratio.size):
+                if (ratio[j] >= thresholds[i]) == got_hard[j]:
+                    hits += 1
+            accuracy[i] = hits / ratio.size
+        return accuracy
+else:
+    def _sweep_thresholds(ratio, got_hard, thresholds):
+        """Prediction accuracy per threshold via a NumPy broadcast (used when numba is unavailable)."""
+        return ((ratio[None, :] >= thresholds[:, None]) == got_hard[None, :]).mean(axis=1)
+
+@functools.lru_cache(maxsize=256)
+def _module2_difficulty(module1_correct: int, module1_total: int, threshold: float) -> str:
+    return 'hard' if (module1_correct / module1_total) >= threshold else 'easy'
+
+QuestionRecord = namedtuple('QuestionRecord', 'subject section topic correct time_spent_s question_id complexity')
+
+def _flatten(q: Dict) -> QuestionRecord:
+    """Flatten a raw student response document into a QuestionRecord."""
+    return QuestionRecord(
+        subject=(q.get('subject') or {}).get('name'),
+        section=q.get('section'),
+        topic=(q.get('topic') or {}).get('name'),
+        correct=bool(q.get('correct')),
+        time_spent_s=(q.get('time_spent') or 0) / 1000,
+        question_id=q.get('question_id', q.get('_id')),
+        complexity=q.get('compleixty', q.get('complexity', 'Unknown'))
+    )
+
+class PreparedData(NamedTuple):
+    """Per-file view of student data shared by performance and what-if analysis."""
+    source: List
+    records: List[QuestionRecord]
+    frame: pd.DataFrame
+    index: Dict[str, Dict[str, np.ndarray]]
+    module_counts: Dict[str, Tuple[int, int, int, int]]
 
 class DSATWhatIfAnalyzer:
     """Analyzes DSAT performance and identifies high-impact questions for score improvement."""
@@ -15,6 +102,8 @@ class DSATWhatIfAnalyzer:
         self.scoring_maps = scoring_maps
         self.adaptive_threshold = adaptive_threshold
         self.placeholder_scoring = False
+        self._cache: Dict[str, PreparedData] = {}
+        self._perf_cache: Dict[str, Dict[str, Tuple[int, int, int, str, int, float]]] = {}
         if not scoring_maps:
             print("Warning: No scoring maps provided. Using placeholder scoring.")
             self.placeholder_scoring = True
@@ -22,13 +111,27 @@ class DSATWhatIfAnalyzer:
                 {"key": "Math", "map": [{"raw": i, "hard": 200 + i * 15, "easy": 200 + i * 10} for i in range(45)]},
                 {"key": "Reading and Writing", "map": [{"raw": i, "hard": 200 + i * 11, "easy": 200 + i * 8} for i in range(55)]}
             ]
+        self._lut = {item['key']: self._build_lut(item['map']) for item in self.scoring_maps if item.get('map')}
 
-    def load_student_data(self, collection: pymongo.collection.Collection = None, source_file: str = None, use_mongodb: bool = True) -> List[Dict]:
-        """Load student response data from MongoDB or local JSON file."""
+    @staticmethod
+    def _build_lut(map_data: List[Dict]) -> Dict[str, np.ndarray]:
+        """Convert a scoring map into dense raw-score-indexed arrays per Module 2 difficulty."""
+        raws = np.fromiter((score['raw'] for score in map_data), dtype=np.int32, count=len(map_data))
+        lut = {}
+        for difficulty in ('hard', 'easy'):
+            arr = np.full(raws.max() + 1, 200, dtype=np.int32)
+            arr[raws] = np.fromiter((score[difficulty] for score in map_data), dtype=np.int32, count=len(map_data))
+            lut[difficulty] = arr
+        return lut
+
+    def load_student_data(self, collection: pymongo.collection.Collection = None, source_file: str = None, use_mongodb: bool = True) -> List[QuestionRecord]:
+        """Load student response data from MongoDB or local JSON file as flattened records."""
         data = []
+        from_mongodb = False
         if use_mongodb and collection is not None:
             try:
-                data = list(collection.find({"source_file": source_file}))
+                data = list(collection.find({"source_file": source_file}, STUDENT_PROJECTION))
+                from_mongodb = bool(data)
                 if not data:
                     print(f"No data found for {source_file} in student_results collection. Falling back to local JSON file.")
                     use_mongodb = False
@@ -38,14 +141,19 @@ class DSATWhatIfAnalyzer:
         if not use_mongodb or not data:
             if not os.path.exists(source_file):
                 raise FileNotFoundError(f"File {source_file} not found.")
-            with open(source_file, 'r') as f:
-                data = json.load(f)
+            data = load_json(source_file)
         if not data:
             raise ValueError(f"No valid data loaded from {source_file}.")
-        sections = set(q.get('section', 'Unknown') for q in data)
-        question_ids = [q.get('question_id', q.get('_id')) for q in data]
-        if len(question_ids) != len(set(question_ids)):
-            print(f"Warning: Duplicate question IDs detected in {source_file}. Using 'question_id' for uniqueness.")
+        data = [_flatten(q) for q in data]
+        sections = set(q.section or 'Unknown' for q in data)
+        if not from_mongodb:
+            # MongoDB documents are keyed by question_id already, so only local JSON can repeat one.
+            seen = set()
+            for qid in (q.question_id for q in data):
+                if qid in seen:
+                    print(f"Warning: Duplicate question IDs detected in {source_file}. Using 'question_id' for uniqueness.")
+                    break
+                seen.add(qid)
         print(f"Loaded {source_file}. Unique sections found: {sections}")
         print(f"First few records: {data[:3]}")
         return data
@@ -55,32 +163,76 @@ class DSATWhatIfAnalyzer:
         if module1_total == 0:
             print("Warning: No Module 1 questions found. Defaulting to 'easy' Module 2.")
             return 'easy'
-        return 'hard' if (module1_correct / module1_total) >= self.adaptive_threshold else 'easy'
+        return _module2_difficulty(module1_correct, module1_total, self.adaptive_threshold)
 
     def calculate_scaled_score(self, subject: str, raw_score: int, module2_difficulty: str) -> int:
         """Calculate scaled score using scoring maps."""
-        map_data = next((item['map'] for item in self.scoring_maps if item['key'] == subject), None)
-        if not map_data:
+        lut = self._lut.get(subject)
+        if not lut:
             print(f"Warning: No scoring map for {subject}. Returning default score.")
             return 200
-        for score in map_data:
-            if score['raw'] == raw_score:
-                return score[module2_difficulty]
-        return 200
+        arr = lut[module2_difficulty]
+        return int(arr[min(max(raw_score, 0), len(arr) - 1)])
+
+    def _to_frame(self, records: List[QuestionRecord]) -> pd.DataFrame:
+        """Build a DataFrame from flattened records, tagging each row with its module."""
+        df = pd.DataFrame.from_records(records, columns=QuestionRecord._fields)
+        df['module'] = np.where(df['section'] == 'Static', 'M1',
+                                np.where(df['section'].isin(M2_SECTIONS), 'M2', None))
+        return df
 
-    def analyze_performance(self, student_data: List[Dict], source_file: str) -> Dict:
+    def _index(self, df: pd.DataFrame) -> Dict[str, Dict[str, np.ndarray]]:
+        """Group row positions by subject and module, e.g. {'Math': {'M1': [...], 'M2': [...]}}."""
+        index = {subject: {'M1': np.empty(0, dtype=np.intp), 'M2': np.empty(0, dtype=np.intp)} for subject in SUBJECTS}
+        for (subject, module), rows in df.groupby(['subject', 'module']).indices.items():
+            index.setdefault(subject, {})[module] = rows
+        return index
+
+    def _prepare(self, student_data: List[QuestionRecord], source_file: str) -> PreparedData:
+        """Build (or reuse) the DataFrame and per-subject module counts for a file."""
+        cached = self._cache.get(source_file)
+        if cached is not None and cached.source is student_data:
+            return cached
+        self._perf_cache.pop(source_file, None)
+        # Raw documents are accepted too; everything downstream reads QuestionRecord attributes.
+        records = [q if isinstance(q, QuestionRecord) else _flatten(q) for q in student_data]
+        df = self._to_frame(records)
+        index = self._index(df)
+        correct = df['correct'].to_numpy()
+        counts = {
+            (subject, module): (int(correct[rows].sum()), len(rows))
+            for subject, modules in index.items() for module, rows in modules.items()
+        }
+        module_counts = {
+            subject: counts.get((subject, 'M1'), (0, 0)) + counts.get((subject, 'M2'), (0, 0))
+            for subject in SUBJECTS
+        }
+        prepared = PreparedData(student_data, records, df, index, module_counts)
+        self._cache[source_file] = prepared
+        return prepared
+
+    @staticmethod
+    def _by_subject(series: pd.Series) -> Dict[str, Dict[str, str]]:
+        """Split a (subject, topic)-indexed Series into {subject: {topic: value}} dicts."""
+        return {subject: group.droplevel('subject').to_dict() for subject, group in series.groupby(level='subject', sort=False)}
+
+    def analyze_performance(self, student_data: List[QuestionRecord], source_file: str) -> Dict:
         """Analyze student performance by subject and module, including time analysis."""
         performance = {'Math': {'Module 1': {}, 'Module 2': {}}, 'Reading and Writing': {'Module 1': {}, 'Module 2': {}}}
+        prepared = self._prepare(student_data, source_file)
+        perf_cache = self._perf_cache.setdefault(source_file, {})
+        df = prepared.frame
+        slow = df['time_spent_s'].to_numpy() > 60
+        topic_stats = df[df['topic'].notna() & (df['topic'] != '')].groupby(['subject', 'topic'], sort=False).agg(
+            correct=('correct', 'sum'), total=('correct', 'size'), mean_time=('time_spent_s', 'mean'))
+        accuracy = topic_stats['correct'] / topic_stats['total']
+        weak_topics = self._by_subject((accuracy[accuracy < 0.5] * 100).map('{:.2f}%'.format))
+        topic_clusters = self._by_subject(
+            'Acc: ' + (accuracy * 100).map('{:.2f}'.format).astype(str)
+            + '%, Avg Time: ' + topic_stats['mean_time'].map('{:.2f}'.format).astype(str) + 's')
         
-        for subject in ['Math', 'Reading and Writing']:
-            subject_data = [q for q in student_data if q.get('subject', {}).get('name') == subject]
-            module1_data = [q for q in subject_data if q.get('section') == 'Static']
-            module2_data = [q for q in subject_data if q.get('section') in ['Hard', 'Adaptive', 'Module 2', 'AdaptiveHard']]
-            
-            module1_correct = sum(1 for q in module1_data if q.get('correct'))
-            module1_total = len(module1_data)
-            module2_correct = sum(1 for q in module2_data if q.get('correct'))
-            module2_total = len(module2_data)
+        for subject in SUBJECTS:
+            module1_correct, module1_total, module2_correct, module2_total = prepared.module_counts[subject]
             raw_score = module1_correct + module2_correct
             
             if module1_total == 0:
@@ -100,21 +252,12 @@ class DSATWhatIfAnalyzer:
             module2_difficulty = self.determine_module2_difficulty(module1_correct, module1_total)
             scaled_score = self.calculate_scaled_score(subject, raw_score, module2_difficulty)
             
+            # Read the QuestionRecords rather than the frame so missing fields stay None instead of NaN.
             slow_questions = [
-                {'question_id': q.get('question_id', q.get('_id')), 'topic': q.get('topic', {}).get('name'), 
-                 'time_spent_s': q.get('time_spent', 0) / 1000}
-                for q in subject_data if q.get('time_spent', 0) / 1000 > 60
+                {'question_id': q.question_id, 'topic': q.topic, 'time_spent_s': q.time_spent_s}
+                for q in (prepared.records[i] for i in np.flatnonzero(slow & (df['subject'] == subject).to_numpy()))
             ]
             
-            topics = defaultdict(lambda: {'correct': 0, 'total': 0, 'time_spent_s': []})
-            for q in subject_data:
-                topic = q.get('topic', {}).get('name')
-                if topic:
-                    topics[topic]['total'] += 1
-                    if q.get('correct'):
-                        topics[topic]['correct'] += 1
-                    topics[topic]['time_spent_s'].append(q.get('time_spent', 0) / 1000)
-            
             performance[subject]['Module 1'] = {
                 'correct': module1_correct,
                 'total': module1_total,
@@ -128,101 +271,85 @@ class DSATWhatIfAnalyzer:
             performance[subject]['raw_score'] = raw_score
             performance[subject]['scaled_score'] = scaled_score
             performance[subject]['slow_questions'] = slow_questions
-            performance[subject]['weak_topics'] = {
-                topic: f"{(stats['correct'] / stats['total'])*100:.2f}%"
-                for topic, stats in topics.items() if stats['total'] > 0 and stats['correct'] / stats['total'] < 0.5
-            }
-            performance[subject]['topic_clusters'] = {
-                topic: f"Acc: {(stats['correct'] / stats['total'])*100:.2f}%, Avg Time: {sum(stats['time_spent_s']) / len(stats['time_spent_s']):.2f}s"
-                for topic, stats in topics.items() if stats['total'] > 0
-            }
+            performance[subject]['weak_topics'] = weak_topics.get(subject, {})
+            performance[subject]['topic_clusters'] = topic_clusters.get(subject, {})
+            perf_cache[subject] = (module1_correct, module1_total, module2_correct, module2_difficulty, scaled_score,
+                                   self.adaptive_threshold)
         
         return performance
 
-    def what_if_analysis(self, student_data: List[Dict], source_file: str, additional_correct: int = 2) -> Dict:
+    def what_if_analysis(self, student_data: List[QuestionRecord], source_file: str, additional_correct: int = 2) -> Dict:
         """Perform what-if analysis by simulating additional correct Module 1 answers."""
         results = {}
-        for subject in ['Math', 'Reading and Writing']:
-            subject_data = [q for q in student_data if q.get('subject', {}).get('name') == subject]
-            module1_data = [q for q in subject_data if q.get('section') == 'Static']
-            module2_data = [q for q in subject_data if q.get('section') in ['Hard', 'Adaptive', 'Module 2', 'AdaptiveHard']]
-            
-            module1_correct = sum(1 for q in module1_data if q.get('correct'))
-            module1_total = len(module1_data)
-            module2_correct = sum(1 for q in module2_data if q.get('correct'))
-            current_raw_score = module1_correct + module2_correct
-            current_difficulty = self.determine_module2_difficulty(module1_correct, module1_total)
-            current_score = self.calculate_scaled_score(subject, current_raw_score, current_difficulty)
+        prepared = self._prepare(student_data, source_file)
+        perf_cache = self._perf_cache.get(source_file, {})
+        for subject in SUBJECTS:
+            # Difficulty and score depend on the threshold, which may have been retuned since analyze_performance.
+            if subject in perf_cache and perf_cache[subject][-1] == self.adaptive_threshold:
+                module1_correct, module1_total, module2_correct, current_difficulty, current_score, _ = perf_cache[subject]
+            else:
+                module1_correct, module1_total, module2_correct, _ = prepared.module_counts[subject]
+                current_raw_score = module1_correct + module2_correct
+                current_difficulty = self.determine_module2_difficulty(module1_correct, module1_total)
+                current_score = self.calculate_scaled_score(subject, current_raw_score, current_difficulty)
             
             new_module1_correct = min(module1_correct + additional_correct, module1_total)
             new_difficulty = self.determine_module2_difficulty(new_module1_correct, module1_total)
             new_raw_score = new_module1_correct + module2_correct
             new_score = self.calculate_scaled_score(subject, new_raw_score, new_difficulty)
             
-            high_impact_questions = [
-                q for q in module1_data 
-                if not q.get('correct')
-            ]
+            # The slowest wrong Module 1 answers are the likeliest quick wins.
+            records = prepared.records
+            wrong_answers = (records[i] for i in prepared.index[subject]['M1'] if not records[i].correct)
+            high_impact_questions = heapq.nlargest(additional_correct, wrong_answers, key=lambda q: q.time_spent_s)
             
             results[subject] = {
                 'current_score': current_score,
                 'new_score': new_score,
                 'score_gain': new_score - current_score,
                 'high_impact_questions': [
-                    {'question_id': q.get('question_id', q.get('_id')), 'topic': q.get('topic', {}).get('name'), 
-                     'complexity': q.get('compleixty', q.get('complexity', 'Unknown'))}
-                    for q in high_impact_questions[:additional_correct]
+                    {'question_id': q.question_id, 'topic': q.topic, 'complexity': q.complexity}
+                    for q in high_impact_questions
                 ]
             }
         
         return results
 
+    @staticmethod
+    def _threshold_arrays(data: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Convert threshold data into Module 1 ratios and actual hard/easy outcomes, skipping empty modules."""
+        correct = np.array([student['module1_correct'] for student in data], dtype=np.float64)
+        total = np.array([student['module1_total'] for student in data], dtype=np.float64)
+        got_hard = np.array([bool(student['got_hard_module2']) for student in data], dtype=bool)
+        valid = total > 0
+        return correct[valid] / total[valid], got_hard[valid]
+
     def calculate_prediction_accuracy(self, data: List[Dict], threshold: float) -> float:
         """Calculate accuracy of threshold in predicting Module 2 difficulty."""
-        correct_predictions = 0
-        total_valid = 0
-        for student in data:
-            if student['module1_total'] == 0:
-                continue
-            predicted = 'hard' if (student['module1_correct'] / student['module1_total']) >= threshold else 'easy'
-            actual = 'hard' if student['got_hard_module2'] else 'easy'
-            if predicted == actual:
-                correct_predictions += 1
-            total_valid += 1
-        return correct_predictions / total_valid if total_valid else 0
+        ratio, got_hard = self._threshold_arrays(data)
+        return float(((ratio >= threshold) == got_hard).mean()) if ratio.size else 0
 
     def find_optimal_threshold(self, data: List[Dict]) -> float:
         """Find optimal Module 1 threshold for Module 2 difficulty."""
-        best_accuracy = 0
-        best_threshold = 0.5
-        for threshold in np.arange(0.3, 0.8, 0.05):
-            accuracy = self.calculate_prediction_accuracy(data, threshold)
-            if accuracy > best_accuracy:
-                best_accuracy = accuracy
-                best_threshold = threshold
-        return best_threshold
+        ratio, got_hard = self._threshold_arrays(data)
+        if not ratio.size:
+            return 0.5
+        thresholds = np.arange(0.3, 0.8, 0.05)
+        accuracy = _sweep_thresholds(ratio, got_hard, thresholds)
+        return float(thresholds[accuracy.argmax()]) if accuracy.max() > 0 else 0.5
 
 use_mongodb = True
 try:
-    client = pymongo.MongoClient("mongodb://localhost:27017/", serverSelectionTimeoutMS=5000)
+    client = pymongo.MongoClient("mongodb://localhost:27017/", serverSelectionTimeoutMS=1000, connectTimeoutMS=1000)
     client.server_info() 
     db = client["dsat_analysis"]
     scoring_collection = db["sat_scoring"]
     student_collection = db["student_results"]
+    meta_collection = db["_meta"]
     print("Connected to MongoDB at mongodb://localhost:27017/")
 except pymongo.errors.ServerSelectionTimeoutError as e:
-    print(f"MongoDB connection failed: {e}. Ensure MongoDB server is running on localhost:27017.")
-    try:
-        subprocess.run([r"C:\Program Files\MongoDB\Server\8.0\bin\mongod.exe", "--dbpath", r"C:\data\db"], check=True)
-        client = pymongo.MongoClient("mongodb://localhost:27017/", serverSelectionTimeoutMS=5000)
-        client.server_info()
-        db = client["dsat_analysis"]
-        scoring_collection = db["sat_scoring"]
-        student_collection = db["student_results"]
-        print("Started MongoDB and connected successfully.")
-    except (subprocess.CalledProcessError, pymongo.errors.PyMongoError) as e2:
-        print(f"Failed to start MongoDB: {e2}. Falling back to local JSON files.")
-        use_mongodb = False
+    print(f"MongoDB connection failed: {e}. Ensure MongoDB server is running on localhost:27017. Falling back to local JSON files.")
+    use_mongodb = False
 except pymongo.errors.PyMongoError as e:
     print(f"MongoDB error: {e}. Falling back to local JSON files.")
     use_mongodb = False
@@ -240,13 +367,20 @@ if missing_files:
 scoring_file = 'scoring_DSAT_v2.json'
 scoring_maps = None
 if os.path.exists(scoring_file):
-    with open(scoring_file, 'r') as f:
-        scoring_maps = json.load(f)
+    scoring_maps = load_json(scoring_file)
     if use_mongodb:
         try:
-            scoring_collection.drop()
-            scoring_collection.insert_many(scoring_maps)
-            print(f"Imported {scoring_file} into sat_scoring collection")
+            digest = file_md5(scoring_file)
+            # The insert below is unacknowledged, so confirm it landed before trusting the stored hash.
+            if (meta_collection.find_one({'path': scoring_file, 'hash': digest})
+                    and scoring_collection.estimated_document_count() == len(scoring_maps)):
+                print(f"{scoring_file} unchanged since last import. Skipping sat_scoring import.")
+            else:
+                scoring_collection.drop()
+                # Scoring maps are only written here, never read back, so skip waiting for acknowledgment.
+                scoring_collection.with_options(write_concern=WriteConcern(w=0)).insert_many(scoring_maps, ordered=False)
+                meta_collection.update_one({'path': scoring_file}, {'$set': {'hash': digest}}, upsert=True)
+                print(f"Imported {scoring_file} into sat_scoring collection")
         except pymongo.errors.PyMongoError as e:
             print(f"Failed to import {scoring_file} to MongoDB: {e}. Using local scoring maps.")
 else:
@@ -263,32 +397,36 @@ if use_mongodb:
     for file_path in file_paths:
         if os.path.exists(file_path):
             try:
-                with open(file_path, 'r') as f:
-                    student_data = json.load(f)
-                    for record in student_data:
-                        record['source_file'] = file_path
-                        if 'question_id' in record:
-                            record['_id'] = f"{record['question_id']}_{file_path}"
-                        else:
-                            record['_id'] = f"{record['_id']}_{file_path}"
-                student_collection.drop()  
-                try:
-                    student_collection.insert_many(student_data, ordered=False)
-                    print(f"Imported {file_path} into student_results collection")
-                except pymongo.errors.BulkWriteError as bwe:
-                    print(f"Duplicate key errors in {file_path}. Inserting records individually.")
-                    inserted_ids = set()
-                    for record in student_data:
-                        try:
-                            if record['_id'] not in inserted_ids:
-                                student_collection.insert_one(record)
-                                inserted_ids.add(record['_id'])
-                        except pymongo.errors.DuplicateKeyError:
-                            print(f"Skipping duplicate _id: {record['_id']}")
+                digest = file_md5(file_path)
+                # student_results may have been dropped since the hash was stored; re-import in that case.
+                if (meta_collection.find_one({'path': file_path, 'hash': digest})
+                        and student_collection.find_one({'source_file': file_path}, {'_id': 1})):
+                    print(f"{file_path} unchanged since last import. Skipping student_results import.")
+                    continue
+                # Forget the old hash first so a partial re-import is never mistaken for a finished one.
+                meta_collection.delete_one({'path': file_path})
+                student_collection.delete_many({'source_file': file_path})
+                # Copy records so the cached parse used by load_student_data stays untouched.
+                student_data = [
+                    dict(record, source_file=file_path, _id=f"{record['question_id'] if 'question_id' in record else record['_id']}_{file_path}")
+                    for record in load_json(file_path)
+                ]
+                # $setOnInsert keeps the first copy of a duplicated _id, like the old insert-then-skip fallback.
+                operations = [UpdateOne({'_id': record['_id']}, {'$setOnInsert': record}, upsert=True) for record in student_data]
+                for i in range(0, len(operations), BULK_CHUNK_SIZE):
+                    student_collection.bulk_write(operations[i:i + BULK_CHUNK_SIZE], ordered=False)
+                meta_collection.update_one({'path': file_path}, {'$set': {'hash': digest}}, upsert=True)
+                print(f"Imported {file_path} into student_results collection")
             except pymongo.errors.PyMongoError as e:
                 print(f"Failed to import {file_path} to MongoDB: {e}. Processing locally.")
         else:
             print(f"Warning: {file_path} not found. Skipping import.")
+    try:
+        # Created after the imports above, since dropping sat_scoring also drops its indexes.
+        student_collection.create_index([('source_file', 1), ('subject.name', 1), ('section', 1)])
+        scoring_collection.create_index('key')
+    except pymongo.errors.PyMongoError as e:
+        print(f"Failed to create MongoDB indexes: {e}. Queries will scan the collection.")
 else:
     print("MongoDB unavailable. Processing JSON files locally.")
 
@@ -356,20 +494,27 @@ threshold_data = [
 optimal_threshold = analyzer.find_optimal_threshold(threshold_data)
 print(f"\nOptimal Threshold: {optimal_threshold*100:.2f}%")
 
+# The PNG is only for offline viewing; web consumers use the Chart.js config written below.
+emit_png = os.environ.get('DSAT_EMIT_PNG') == '1'
+if emit_png:
+    _FIG, _AX = plt.subplots(figsize=(12, 6))
+
 if results:
     labels = [f"{r['subject']} ({r['file'].split('/')[-1]})" for r in results]
     scores = [r['scaled_score'] for r in results]
-    plt.figure(figsize=(12, 6))
-    plt.bar(labels, scores, color=['#4CAF50' if '+2' not in label else '#66BB6A' for label in labels])
-    plt.xlabel('Subject and File')
-    plt.ylabel('Scaled Score (200-800)')
-    plt.title('What-If Analysis: Current vs. +2 Correct in Module 1')
-    plt.xticks(rotation=45, ha='right')
-    plt.ylim(0, 800)
-    plt.tight_layout()
-    plt.savefig('what_if_analysis.png')
-    plt.close()
-    print("Matplotlib chart saved to what_if_analysis.png")
+    if emit_png:
+        _AX.clear()
+        _AX.bar(labels, scores, color=['#4CAF50' if '+2' not in label else '#66BB6A' for label in labels])
+        _AX.set_xlabel('Subject and File')
+        _AX.set_ylabel('Scaled Score (200-800)')
+        _AX.set_title('What-If Analysis: Current vs. +2 Correct in Module 1')
+        plt.setp(_AX.get_xticklabels(), rotation=45, ha='right')
+        _AX.set_ylim(0, 800)
+        _FIG.savefig('what_if_analysis.png', dpi=100, bbox_inches='tight')
+        _AX.cla()
+        print("Matplotlib chart saved to what_if_analysis.png")
+    else:
+        print("Skipping what_if_analysis.png (set DSAT_EMIT_PNG=1 to render it).")
 else:
     print("No results to visualize. Please ensure student data files contain valid questions.")
 
@@ -402,6 +547,6 @@ chartjs_config = {
         }
     }
 }
-with open('chartjs_config.json', 'w') as f:
-    json.dump(chartjs_config, f)
+with open('chartjs_config.json', 'wb') as f:
+    f.write(_dumps(chartjs_config))
 print("Chart.js config saved to chartjs_config.json")
\ No newline at end of file